@@ -1,12 +1,26 @@
 import collections
+import functools
 import numpy as np
 import torch
+from dataclasses import dataclass
 from enum import IntEnum
-from scipy.interpolate import interp1d
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _eval_lane(ds, lane, s):
+    """piecewise-linear lane evaluation at arc length s, extrapolating at the ends"""
+    s = np.asarray(s)
+    i = np.clip(np.searchsorted(ds, s) - 1, 0, len(ds) - 2)
+    t = (s - ds[i]) / (ds[i + 1] - ds[i])
+    return lane[i] + t[..., None] * (lane[i + 1] - lane[i])
 
 
 def interp_lanes(lane):
-    """ generate interpolants for lanes 
+    """ generate interpolants for lanes
 
     Args:
         lane (np.array()): [Nx3]
@@ -16,85 +30,93 @@ def interp_lanes(lane):
     """
     ds = np.cumsum(
         np.hstack([0., np.linalg.norm(lane[1:, :2]-lane[:-1, :2], axis=-1)]))
-    return interp1d(ds, lane, fill_value="extrapolate", assume_sorted=True, axis=0), lane[0]
+    return functools.partial(_eval_lane, ds, lane), lane[0]
+
+
+def round_2pi(x):
+    return (x + np.pi) % (2 * np.pi) - np.pi
 
 
-def batch_proj(x, line):
-    # x:[batch,3], line:[batch,N,3]
-    line_length = line.shape[-2]
-    batch_dim = x.ndim - 1
+def round_2pi_(x):
+    """In-place round_2pi for callers that own ``x`` (e.g. a fresh temporary)."""
     if isinstance(x, torch.Tensor):
-        delta = line[..., 0:2] - torch.unsqueeze(x[..., 0:2], dim=-2).repeat(
-            *([1] * batch_dim), line_length, 1
-        )
-        dis = torch.linalg.norm(delta, axis=-1)
-        idx0 = torch.argmin(dis, dim=-1)
-        idx = idx0.view(*line.shape[:-2], 1, 1).repeat(
-            *([1] * (batch_dim + 1)), line.shape[-1]
-        )
-        line_min = torch.squeeze(torch.gather(line, -2, idx), dim=-2)
-        dx = x[..., None, 0] - line[..., 0]
-        dy = x[..., None, 1] - line[..., 1]
-        delta_y = -dx * torch.sin(line_min[..., None, 2]) + dy * torch.cos(
-            line_min[..., None, 2]
-        )
-        delta_x = dx * torch.cos(line_min[..., None, 2]) + dy * torch.sin(
-            line_min[..., None, 2]
-        )
-        ref_pts = torch.stack(
-            [
-                line_min[..., 0] + delta_x * torch.cos(line_min[..., 2]),
-                line_min[..., 1] + delta_x * torch.sin(line_min[..., 2]),
-                line_min[..., 2],
-            ],
-            dim=-1,
-        )
-        delta_psi = round_2pi(x[..., 2] - line_min[..., 2])
+        x.add_(np.pi)
+        x.remainder_(2 * np.pi)
+        x.sub_(np.pi)
+        return x
+    if not isinstance(x, np.ndarray):
+        # 0-d results degrade to numpy scalars, which reject out=
+        return round_2pi(x)
+    np.add(x, np.pi, out=x)
+    np.mod(x, 2 * np.pi, out=x)
+    np.subtract(x, np.pi, out=x)
+    return x
 
-        return (
-            delta_x,
-            delta_y,
-            torch.unsqueeze(delta_psi, dim=-1),
-            ref_pts,
-        )
-    elif isinstance(x, np.ndarray):
-        delta = line[..., 0:2] - np.repeat(
-            x[..., np.newaxis, 0:2], line_length, axis=-2
-        )
-        dis = np.linalg.norm(delta, axis=-1)
-        idx0 = np.argmin(dis, axis=-1)
-        idx = idx0.reshape(*line.shape[:-2], 1,
-                           1).repeat(line.shape[-1], axis=-1)
-        line_min = np.squeeze(np.take_along_axis(line, idx, axis=-2), axis=-2)
-        dx = x[..., None, 0] - line[..., 0]
-        dy = x[..., None, 1] - line[..., 1]
-        delta_y = -dx * np.sin(line_min[..., None, 2]) + dy * np.cos(
-            line_min[..., None, 2]
-        )
-        delta_x = dx * np.cos(line_min[..., None, 2]) + dy * np.sin(
-            line_min[..., None, 2]
-        )
-        line_min[..., 0] += delta_x * np.cos(line_min[..., 2])
-        line_min[..., 1] += delta_x * np.sin(line_min[..., 2])
-        delta_psi = round_2pi(x[..., 2] - line_min[..., 2])
-        return (
-            delta_x,
-            delta_y,
-            np.expand_dims(delta_psi, axis=-1),
-            line_min,
-        )
 
+_torch_sincos = getattr(torch, "sincos", None)
 
-def round_2pi(x):
-    return (x + np.pi) % (2 * np.pi) - np.pi
+
+def _sincos(x):
+    """(sin(x), cos(x)) computed together
+
+    Dispatches to the fused torch.sincos when the running torch build
+    provides one; otherwise each angle tensor is still evaluated exactly
+    once per function instead of once per use at the call sites.
+    """
+    if isinstance(x, torch.Tensor):
+        if _torch_sincos is not None:
+            return _torch_sincos(x)
+        return torch.sin(x), torch.cos(x)
+    return np.sin(x), np.cos(x)
+
+
+@dataclass
+class State:
+    """structure-of-arrays layout for (x, y, psi) agent states
+
+    Keeping each component in its own tensor/array lets the hot kernels
+    read dense vectors instead of stride-3 slices of an [..., 3] block.
+    """
+    x: "torch.Tensor | np.ndarray"
+    y: "torch.Tensor | np.ndarray"
+    psi: "torch.Tensor | np.ndarray"
+
+    @classmethod
+    def from_aos(cls, t):
+        """component views of a trailing-axis [..., 3] state block"""
+        return cls(t[..., 0], t[..., 1], t[..., 2])
+
+    def to_aos(self):
+        if isinstance(self.x, torch.Tensor):
+            return torch.stack([self.x, self.y, self.psi], dim=-1)
+        return np.stack([self.x, self.y, self.psi], axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def _corner_signs(device, dtype):
+    return torch.tensor(
+        [[-1, -1], [-1, 1], [1, 1], [1, -1]], device=device, dtype=dtype) * 0.5
+
+
+@functools.lru_cache(maxsize=None)
+def _veh_corner_signs(device, dtype):
+    return torch.tensor(
+        [[0.5, 0.5], [0.5, -0.5], [-0.5, 0.5], [-0.5, -0.5]],
+        device=device, dtype=dtype)
+
+
+@functools.lru_cache(maxsize=None)
+def _corner_offset(offsetX, offsetY, device, dtype):
+    return torch.tensor([offsetX, offsetY], device=device, dtype=dtype)
 
 
 def get_box_world_coords(pos, yaw, extent):
-    corners = (torch.tensor([[-1, -1], [-1, 1], [1, 1], [1, -1]]) * 0.5).to(pos.device) * (
+    corners = _corner_signs(pos.device, pos.dtype) * (
         extent.unsqueeze(-2)
     )
-    s = torch.sin(yaw).unsqueeze(-1)
-    c = torch.cos(yaw).unsqueeze(-1)
+    s, c = _sincos(yaw)
+    s = s.unsqueeze(-1)
+    c = c.unsqueeze(-1)
     rotM = torch.cat((torch.cat((c, s), dim=-1),
                      torch.cat((-s, c), dim=-1)), dim=-2)
     rotated_corners = (corners + pos.unsqueeze(-2)) @ rotM
@@ -109,11 +131,11 @@ def get_upright_box(pos, extent):
 
 
 def batch_nd_transform_points(points, Mat):
+    """apply the affine part of Mat to points; the projective last row is ignored"""
     ndim = Mat.shape[-1] - 1
-    Mat = torch.transpose(Mat, -1, -2)
-    return (points.unsqueeze(-2) @ Mat[..., :ndim, :ndim]).squeeze(-2) + Mat[
-        ..., -1:, :ndim
-    ].squeeze(-2)
+    R = Mat[..., :ndim, :ndim]
+    t = Mat[..., :ndim, -1]
+    return torch.einsum("...f,...gf->...g", points, R) + t
 
 
 def transform_points_tensor(
@@ -167,200 +189,366 @@ def transform_points_tensor(
 
     def _transform(points: torch.Tensor, transf_matrix: torch.Tensor) -> torch.Tensor:
         num_dims = transf_matrix.shape[-1] - 1
-        transf_matrix = torch.permute(transf_matrix, (0, 2, 1))
-        return (
-            points @ transf_matrix[:, :num_dims, :num_dims]
-            + transf_matrix[:, -1:, :num_dims]
-        )
+        R = transf_matrix[..., :num_dims, :num_dims]
+        t = transf_matrix[..., :num_dims, -1]
+        return torch.einsum("...nf,...gf->...ng", points, R) + t.unsqueeze(-2)
 
     if points.ndim == transf_matrix.ndim == 2:
-        points = torch.unsqueeze(points, 0)
-        transf_matrix = torch.unsqueeze(transf_matrix, 0)
-        return _transform(points, transf_matrix)[0]
+        return _transform(points, transf_matrix)
 
     elif points.ndim == transf_matrix.ndim == 3:
         return _transform(points, transf_matrix)
 
     elif points.ndim == 3 and transf_matrix.ndim == 2:
-        transf_matrix = torch.unsqueeze(transf_matrix, 0)
-        return _transform(points, transf_matrix)
+        # matmul broadcasts the shared matrix over the batch dim natively
+        num_dims = matrix_feat - 1
+        R = transf_matrix[:num_dims, :num_dims]
+        t = transf_matrix[:num_dims, -1]
+        return points @ R.T + t
     else:
         raise NotImplementedError(
             f"unsupported case!{points_log},{matrix_log}")
 
 
+def _maybe_compile(fn):
+    """run elementwise collision kernels through torch.compile when available
+
+    torch.compile defers actual compilation to the first call, so backend
+    failures (e.g. no C++ toolchain for Inductor) surface there; the wrapper
+    catches them and permanently falls back to the eager function.
+    """
+    if not hasattr(torch, "compile"):
+        return fn
+    try:
+        compiled = torch.compile(fn, dynamic=True)
+    except Exception:
+        return fn
+    active = compiled
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        nonlocal active
+        try:
+            return active(*args, **kwargs)
+        except Exception:
+            if active is fn:
+                raise
+            active = fn
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+@_maybe_compile
+def _ped_ped_kernel(p1, p2, S1, S2):
+    return (
+        torch.linalg.norm(p1[..., 0:2] - p2[..., 0:2], dim=-1)
+        - (S1[..., 0] + S2[..., 0]) / 2
+    )
+
+
+@_maybe_compile
+def _veh_veh_kernel(p1, p2, S1, S2, signs, offset):
+    corners = signs * (S1[..., None, :2] + offset)
+    theta1 = p1[..., 2]
+    theta2 = p2[..., 2]
+    dx = p1[..., 0:2] - p2[..., 0:2]
+    delta_x1 = _batch_rotate_2d_torch(
+        corners, theta1[..., None]) + dx[..., None, :]
+    delta_x2 = _batch_rotate_2d_torch(delta_x1, -theta2[..., None])
+    dis = torch.maximum(
+        torch.abs(delta_x2[..., 0]) - 0.5 * S2[..., None, 0],
+        torch.abs(delta_x2[..., 1]) - 0.5 * S2[..., None, 1],
+    )
+    return torch.min(dis, dim=-1)[0]
+
+
+@_maybe_compile
+def _veh_ped_kernel(p1, p2, S1, S2):
+    theta = p1[..., 2]
+    dx = _batch_rotate_2d_torch(p2[..., 0:2] - p1[..., 0:2], -theta)
+    return torch.maximum(
+        torch.abs(dx[..., 0]) - S1[..., 0] / 2 - S2[..., 0] / 2,
+        torch.abs(dx[..., 1]) - S1[..., 1] / 2 - S2[..., 0] / 2,
+    )
+
+
+def _ped_ped_collision_torch(p1, p2, S1, S2):
+    return _ped_ped_kernel(p1, p2, S1, S2)
+
+
+def _ped_ped_collision_np(p1, p2, S1, S2):
+    return (
+        np.linalg.norm(p1[..., 0:2] - p2[..., 0:2], axis=-1)
+        - (S1[..., 0] + S2[..., 0]) / 2
+    )
+
+
+def _ped_ped_collision_state(p1, p2, S1, S2):
+    if isinstance(p2, State):
+        p2 = p2.to_aos()
+    return PED_PED_collision(p1.to_aos(), p2, S1, S2)
+
+
+@functools.singledispatch
 def PED_PED_collision(p1, p2, S1, S2):
-    if isinstance(p1, torch.Tensor):
+    raise NotImplementedError
 
-        return (
-            torch.linalg.norm(p1[..., 0:2] - p2[..., 0:2], dim=-1)
-            - (S1[..., 0] + S2[..., 0]) / 2
-        )
 
-    elif isinstance(p1, np.ndarray):
+PED_PED_collision.register(torch.Tensor, _ped_ped_collision_torch)
+PED_PED_collision.register(np.ndarray, _ped_ped_collision_np)
+PED_PED_collision.register(State, _ped_ped_collision_state)
 
-        return (
-            np.linalg.norm(p1[..., 0:2] - p2[..., 0:2], axis=-1)
-            - (S1[..., 0] + S2[..., 0]) / 2
-        )
-    else:
-        raise NotImplementedError
+
+def PED_PED_collision_sq(p1, p2, S1, S2):
+    """squared variant of PED_PED_collision with the same sign
+
+    Skips the sqrt, so callers that only test the sign (collision or not)
+    compare squared distance against the squared radius sum.
+    """
+    dxy = p1[..., 0:2] - p2[..., 0:2]
+    r = (S1[..., 0] + S2[..., 0]) / 2
+    return (dxy * dxy).sum(-1) - r * r
+
+
+def _batch_rotate_2d_torch(xy, theta):
+    s, c = _sincos(theta)
+    x1 = xy[..., 0] * c - xy[..., 1] * s
+    y1 = xy[..., 1] * c + xy[..., 0] * s
+    return torch.stack([x1, y1], dim=-1)
 
 
+def _batch_rotate_2d_np(xy, theta):
+    s, c = _sincos(theta)
+    x1 = xy[..., 0] * c - xy[..., 1] * s
+    y1 = xy[..., 1] * c + xy[..., 0] * s
+    return np.concatenate((x1[..., None], y1[..., None]), axis=-1)
+
+
+@functools.singledispatch
 def batch_rotate_2D(xy, theta):
-    if isinstance(xy, torch.Tensor):
-        x1 = xy[..., 0] * torch.cos(theta) - xy[..., 1] * torch.sin(theta)
-        y1 = xy[..., 1] * torch.cos(theta) + xy[..., 0] * torch.sin(theta)
-        return torch.stack([x1, y1], dim=-1)
-    elif isinstance(xy, np.ndarray):
-        x1 = xy[..., 0] * np.cos(theta) - xy[..., 1] * np.sin(theta)
-        y1 = xy[..., 1] * np.cos(theta) + xy[..., 0] * np.sin(theta)
-        return np.concatenate((x1[..., None], y1[..., None]), axis=-1)
+    raise NotImplementedError
+
+
+batch_rotate_2D.register(torch.Tensor, _batch_rotate_2d_torch)
+batch_rotate_2D.register(np.ndarray, _batch_rotate_2d_np)
+
+
+def _veh_veh_collision_torch(
+    p1, p2, S1, S2, alpha=5, return_dis=False, offsetX=1.0, offsetY=0.3
+):
+    signs = _veh_corner_signs(p1.device, p1.dtype)
+    offset = _corner_offset(offsetX, offsetY, p1.device, p1.dtype)
+    return _veh_veh_kernel(p1, p2, S1, S2, signs, offset)
 
 
+def _veh_veh_collision_np(
+    p1, p2, S1, S2, alpha=5, return_dis=False, offsetX=1.0, offsetY=0.3
+):
+    signs = np.array(
+        [[0.5, 0.5], [0.5, -0.5], [-0.5, 0.5], [-0.5, -0.5]])
+    corners = signs * (S1[..., None, :2] + np.array([offsetX, offsetY]))
+    theta1 = p1[..., 2]
+    theta2 = p2[..., 2]
+    dx = p1[..., 0:2] - p2[..., 0:2]
+    delta_x1 = _batch_rotate_2d_np(
+        corners, theta1[..., None]) + dx[..., None, :]
+    delta_x2 = _batch_rotate_2d_np(delta_x1, -theta2[..., None])
+    dis = np.maximum(
+        np.abs(delta_x2[..., 0]) - 0.5 * S2[..., None, 0],
+        np.abs(delta_x2[..., 1]) - 0.5 * S2[..., None, 1],
+    )
+    min_dis = np.min(dis, axis=-1)
+    return min_dis
+
+
+def _veh_veh_collision_state(p1, p2, S1, S2, **kwargs):
+    if isinstance(p2, State):
+        p2 = p2.to_aos()
+    return VEH_VEH_collision(p1.to_aos(), p2, S1, S2, **kwargs)
+
+
+@functools.singledispatch
 def VEH_VEH_collision(
     p1, p2, S1, S2, alpha=5, return_dis=False, offsetX=1.0, offsetY=0.3
 ):
-    if isinstance(p1, torch.Tensor):
-        cornersX = torch.kron(
-            S1[..., 0] +
-            offsetX, torch.tensor([0.5, 0.5, -0.5, -0.5]).to(p1.device)
-        )
-        cornersY = torch.kron(
-            S1[..., 1] +
-            offsetY, torch.tensor([0.5, -0.5, 0.5, -0.5]).to(p1.device)
-        )
-        corners = torch.stack([cornersX, cornersY], dim=-1)
-        theta1 = p1[..., 2]
-        theta2 = p2[..., 2]
-        dx = (p1[..., 0:2] - p2[..., 0:2]).repeat_interleave(4, dim=-2)
-        delta_x1 = batch_rotate_2D(
-            corners, theta1.repeat_interleave(4, dim=-1)) + dx
-        delta_x2 = batch_rotate_2D(
-            delta_x1, -theta2.repeat_interleave(4, dim=-1))
-        dis = torch.maximum(
-            torch.abs(delta_x2[..., 0]) - 0.5 *
-            S2[..., 0].repeat_interleave(4, dim=-1),
-            torch.abs(delta_x2[..., 1]) - 0.5 *
-            S2[..., 1].repeat_interleave(4, dim=-1),
-        ).view(*S1.shape[:-1], 4)
-        min_dis, _ = torch.min(dis, dim=-1)
-
-        return min_dis
-
-    elif isinstance(p1, np.ndarray):
-        cornersX = np.kron(S1[..., 0] + offsetX,
-                           np.array([0.5, 0.5, -0.5, -0.5]))
-        cornersY = np.kron(S1[..., 1] + offsetY,
-                           np.array([0.5, -0.5, 0.5, -0.5]))
-        corners = np.concatenate((cornersX, cornersY), axis=-1)
-        theta1 = p1[..., 2]
-        theta2 = p2[..., 2]
-        dx = (p1[..., 0:2] - p2[..., 0:2]).repeat(4, axis=-2)
-        delta_x1 = batch_rotate_2D(corners, theta1.repeat(4, axis=-1)) + dx
-        delta_x2 = batch_rotate_2D(delta_x1, -theta2.repeat(4, axis=-1))
-        dis = np.maximum(
-            np.abs(delta_x2[..., 0]) - 0.5 * S2[..., 0].repeat(4, axis=-1),
-            np.abs(delta_x2[..., 1]) - 0.5 * S2[..., 1].repeat(4, axis=-1),
-        ).reshape(*S1.shape[:-1], 4)
-        min_dis = np.min(dis, axis=-1)
-        return min_dis
-    else:
-        raise NotImplementedError
+    raise NotImplementedError
+
 
+VEH_VEH_collision.register(torch.Tensor, _veh_veh_collision_torch)
+VEH_VEH_collision.register(np.ndarray, _veh_veh_collision_np)
+VEH_VEH_collision.register(State, _veh_veh_collision_state)
 
+
+def _veh_ped_collision_torch(p1, p2, S1, S2):
+    return _veh_ped_kernel(p1, p2, S1, S2)
+
+
+def _veh_ped_collision_np(p1, p2, S1, S2):
+    theta = p1[..., 2]
+    dx = _batch_rotate_2d_np(p2[..., 0:2] - p1[..., 0:2], -theta)
+    return np.maximum(
+        np.abs(dx[..., 0]) - S1[..., 0] / 2 - S2[..., 0] / 2,
+        np.abs(dx[..., 1]) - S1[..., 1] / 2 - S2[..., 0] / 2,
+    )
+
+
+def _veh_ped_collision_state(p1, p2, S1, S2):
+    if isinstance(p2, State):
+        p2 = p2.to_aos()
+    return VEH_PED_collision(p1.to_aos(), p2, S1, S2)
+
+
+@functools.singledispatch
 def VEH_PED_collision(p1, p2, S1, S2):
-    if isinstance(p1, torch.Tensor):
-
-        mask = torch.logical_or(
-            torch.abs(p1[..., 2]) > 0.1, torch.linalg.norm(
-                p2[..., 2:4], dim=-1) > 0.1
-        ).detach()
-        theta = p1[..., 2]
-        dx = batch_rotate_2D(p2[..., 0:2] - p1[..., 0:2], -theta)
-
-        return torch.maximum(
-            torch.abs(dx[..., 0]) - S1[..., 0] / 2 - S2[..., 0] / 2,
-            torch.abs(dx[..., 1]) - S1[..., 1] / 2 - S2[..., 0] / 2,
-        )
-    elif isinstance(p1, np.ndarray):
+    raise NotImplementedError
 
-        theta = p1[..., 2]
-        dx = batch_rotate_2D(p2[..., 0:2] - p1[..., 0:2], -theta)
-        return np.maximum(
-            np.abs(dx[..., 0]) - S1[..., 0] / 2 - S2[..., 0] / 2,
-            np.abs(dx[..., 1]) - S1[..., 1] / 2 - S2[..., 0] / 2,
-        )
-    else:
-        raise NotImplementedError
+
+VEH_PED_collision.register(torch.Tensor, _veh_ped_collision_torch)
+VEH_PED_collision.register(np.ndarray, _veh_ped_collision_np)
+VEH_PED_collision.register(State, _veh_ped_collision_state)
 
 
 def PED_VEH_collision(p1, p2, S1, S2):
     return VEH_PED_collision(p2, p1, S2, S1)
 
 
-def batch_proj(x, line):
-    # x:[batch,3], line:[batch,N,3]
-    line_length = line.shape[-2]
-    batch_dim = x.ndim - 1
-    if isinstance(x, torch.Tensor):
-        delta = line[..., 0:2] - torch.unsqueeze(x[..., 0:2], dim=-2).repeat(
-            *([1] * batch_dim), line_length, 1
-        )
-        dis = torch.linalg.norm(delta, axis=-1)
-        idx0 = torch.argmin(dis, dim=-1)
-        idx = idx0.view(*line.shape[:-2], 1, 1).repeat(
-            *([1] * (batch_dim + 1)), line.shape[-1]
-        )
-        line_min = torch.squeeze(torch.gather(line, -2, idx), dim=-2)
-        dx = x[..., None, 0] - line[..., 0]
-        dy = x[..., None, 1] - line[..., 1]
-        delta_y = -dx * torch.sin(line_min[..., None, 2]) + dy * torch.cos(
-            line_min[..., None, 2]
-        )
-        delta_x = dx * torch.cos(line_min[..., None, 2]) + dy * torch.sin(
-            line_min[..., None, 2]
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _batch_proj_np_kernel(xs, ys, psis, line, out_dx, out_dy, out_dpsi):
+        """fused nearest-point search + frame projection, no intermediates"""
+        B, N = line.shape[0], line.shape[1]
+        for b in numba.prange(B):
+            x0 = xs[b]
+            x1 = ys[b]
+            best_d2 = np.inf
+            best_j = 0
+            for j in range(N):
+                dx = x0 - line[b, j, 0]
+                dy = x1 - line[b, j, 1]
+                d2 = dx * dx + dy * dy
+                if d2 < best_d2:
+                    best_d2 = d2
+                    best_j = j
+            psi = line[b, best_j, 2]
+            s = np.sin(psi)
+            c = np.cos(psi)
+            for j in range(N):
+                dx = x0 - line[b, j, 0]
+                dy = x1 - line[b, j, 1]
+                out_dx[b, j] = dx * c + dy * s
+                out_dy[b, j] = -dx * s + dy * c
+            out_dpsi[b, 0] = (psis[b] - psi + np.pi) % (2 * np.pi) - np.pi
+
+
+def _batch_proj_torch(x, line, return_ref_pts=False):
+    # x: State of tensors, line:[batch,N,3]
+    batch_dim = x.x.ndim
+    dx = x.x[..., None] - line[..., 0]
+    dy = x.y[..., None] - line[..., 1]
+    dis2 = dx * dx + dy * dy
+    idx0 = torch.argmin(dis2, dim=-1)
+    if batch_dim == 0:
+        line_min = line[idx0]
+    else:
+        line_flat = line.reshape(-1, *line.shape[-2:])
+        bidx = torch.arange(line_flat.shape[0], device=line.device)
+        line_min = line_flat[bidx, idx0.reshape(-1)].reshape(
+            *line.shape[:-2], line.shape[-1]
         )
-        # ref_pts = torch.stack(
-        #     [
-        #         line_min[..., 0] + delta_x * torch.cos(line_min[..., 2]),
-        #         line_min[..., 1] + delta_x * torch.sin(line_min[..., 2]),
-        #         line_min[..., 2],
-        #     ],
-        #     dim=-1,
-        # )
-        delta_psi = round_2pi(x[..., 2] - line_min[..., 2])
+    s, c = _sincos(line_min[..., 2])
+    delta_y = -dx * s[..., None] + dy * c[..., None]
+    delta_x = dx * c[..., None] + dy * s[..., None]
+    delta_psi = round_2pi_(x.psi - line_min[..., 2])
 
+    if not return_ref_pts:
         return (
             delta_x,
             delta_y,
             torch.unsqueeze(delta_psi, dim=-1),
         )
-    elif isinstance(x, np.ndarray):
-        delta = line[..., 0:2] - np.repeat(
-            x[..., np.newaxis, 0:2], line_length, axis=-2
-        )
-        dis = np.linalg.norm(delta, axis=-1)
-        idx0 = np.argmin(dis, axis=-1)
-        idx = idx0.reshape(*line.shape[:-2], 1,
-                           1).repeat(line.shape[-1], axis=-1)
-        line_min = np.squeeze(np.take_along_axis(line, idx, axis=-2), axis=-2)
-        dx = x[..., None, 0] - line[..., 0]
-        dy = x[..., None, 1] - line[..., 1]
-        delta_y = -dx * np.sin(line_min[..., None, 2]) + dy * np.cos(
-            line_min[..., None, 2]
-        )
-        delta_x = dx * np.cos(line_min[..., None, 2]) + dy * np.sin(
-            line_min[..., None, 2]
-        )
-        # line_min[..., 0] += delta_x * np.cos(line_min[..., 2])
-        # line_min[..., 1] += delta_x * np.sin(line_min[..., 2])
-        delta_psi = round_2pi(x[..., 2] - line_min[..., 2])
+    ref_pts = torch.stack(
+        [
+            line_min[..., 0, None] + delta_x * c[..., None],
+            line_min[..., 1, None] + delta_x * s[..., None],
+            line_min[..., 2, None].expand_as(delta_x),
+        ],
+        dim=-1,
+    )
+    return (
+        delta_x,
+        delta_y,
+        torch.unsqueeze(delta_psi, dim=-1),
+        ref_pts,
+    )
+
+
+def _batch_proj_np(x, line, return_ref_pts=False):
+    # x: State of arrays, line:[batch,N,3]
+    if numba is not None and not return_ref_pts \
+            and x.x.ndim == 1 and line.ndim == 3:
+        delta_x = np.empty(line.shape[:-1], dtype=x.x.dtype)
+        delta_y = np.empty(line.shape[:-1], dtype=x.x.dtype)
+        delta_psi = np.empty((line.shape[0], 1), dtype=x.x.dtype)
+        _batch_proj_np_kernel(
+            np.ascontiguousarray(x.x), np.ascontiguousarray(x.y),
+            np.ascontiguousarray(x.psi), np.ascontiguousarray(line),
+            delta_x, delta_y, delta_psi)
+        return delta_x, delta_y, delta_psi
+    dx = x.x[..., None] - line[..., 0]
+    dy = x.y[..., None] - line[..., 1]
+    dis2 = dx * dx + dy * dy
+    idx0 = np.argmin(dis2, axis=-1)
+    line_min = np.squeeze(
+        np.take_along_axis(line, idx0[..., None, None], axis=-2), axis=-2
+    )
+    s, c = _sincos(line_min[..., 2])
+    delta_y = -dx * s[..., None] + dy * c[..., None]
+    delta_x = dx * c[..., None] + dy * s[..., None]
+    delta_psi = round_2pi_(x.psi - line_min[..., 2])
+    if not return_ref_pts:
         return (
             delta_x,
             delta_y,
             np.expand_dims(delta_psi, axis=-1),
         )
+    ref_pts = np.stack(
+        [
+            line_min[..., 0, None] + delta_x * c[..., None],
+            line_min[..., 1, None] + delta_x * s[..., None],
+            np.broadcast_to(line_min[..., 2, None], delta_x.shape),
+        ],
+        axis=-1,
+    )
+    return (
+        delta_x,
+        delta_y,
+        np.expand_dims(delta_psi, axis=-1),
+        ref_pts,
+    )
+
+
+def _batch_proj_state(x, line, return_ref_pts=False):
+    if isinstance(x.x, torch.Tensor):
+        return _batch_proj_torch(x, line, return_ref_pts)
+    return _batch_proj_np(x, line, return_ref_pts)
+
+
+@functools.singledispatch
+def batch_proj(x, line, return_ref_pts=False):
+    # x: State or [batch,3], line:[batch,N,3]
+    raise NotImplementedError
+
+
+batch_proj.register(State, _batch_proj_state)
+batch_proj.register(
+    torch.Tensor,
+    lambda x, line, return_ref_pts=False: _batch_proj_torch(
+        State.from_aos(x), line, return_ref_pts))
+batch_proj.register(
+    np.ndarray,
+    lambda x, line, return_ref_pts=False: _batch_proj_np(
+        State.from_aos(x), line, return_ref_pts))
 
 
 class CollisionType(IntEnum):
@@ -370,6 +558,70 @@ class CollisionType(IntEnum):
     SIDE = 2
 
 
+def _box_corners_np(pos, yaw, extent):
+    """world-frame corners of oriented boxes, extent[..., 0] along heading, (..., 4, 2)"""
+    signs = np.array([[-0.5, -0.5], [-0.5, 0.5], [0.5, 0.5], [0.5, -0.5]])
+    corners = signs * extent[..., None, :2]
+    s, c = _sincos(yaw)
+    rot = np.stack([np.stack([c, -s], axis=-1),
+                    np.stack([s, c], axis=-1)], axis=-2)
+    return pos[..., None, :2] + np.einsum("...ij,...kj->...ki", rot, corners)
+
+
+def _obb_overlap_mask(ego_corners, other_corners):
+    """vectorized SAT overlap test between one box (4,2) and N boxes (N,4,2)"""
+    ego_axes = np.stack(
+        [ego_corners[1] - ego_corners[0], ego_corners[3] - ego_corners[0]])
+    other_axes = np.stack(
+        [other_corners[:, 1] - other_corners[:, 0],
+         other_corners[:, 3] - other_corners[:, 0]], axis=1)
+    axes = np.concatenate(
+        [np.broadcast_to(ego_axes, other_axes.shape), other_axes], axis=1)
+    proj_ego = np.einsum("nae,ke->nak", axes, ego_corners)
+    proj_other = np.einsum("nae,nke->nak", axes, other_corners)
+    separated = (proj_ego.max(-1) < proj_other.min(-1)) | (
+        proj_other.max(-1) < proj_ego.min(-1))
+    return ~separated.any(-1)
+
+
+def _side_intersection_lengths(ego_pos, ego_yaw, ego_extent,
+                               other_pos, other_yaw, other_extent):
+    """length of the other box's overlap with ego's front/rear/left/right sides
+
+    Each ego side is clipped as a parametric segment against the other box
+    in that box's own frame (Liang-Barsky against an axis-aligned rect).
+    """
+    hx, hy = 0.5 * ego_extent[0], 0.5 * ego_extent[1]
+    local_sides = np.array([
+        [[hx, -hy], [hx, hy]],     # front
+        [[-hx, -hy], [-hx, hy]],   # rear
+        [[-hx, hy], [hx, hy]],     # left
+        [[-hx, -hy], [hx, -hy]],   # right
+    ])
+    s, c = _sincos(ego_yaw)
+    world = local_sides @ np.array([[c, s], [-s, c]]) + ego_pos[:2]
+    so, co = _sincos(other_yaw)
+    local = (world - other_pos[:2]) @ np.array([[co, -so], [so, co]])
+    p0 = local[:, 0]
+    d = local[:, 1] - local[:, 0]
+    half = 0.5 * np.asarray(other_extent[:2])
+    t0 = np.zeros(4)
+    t1 = np.ones(4)
+    for k in range(2):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ta = (-half[k] - p0[:, k]) / d[:, k]
+            tb = (half[k] - p0[:, k]) / d[:, k]
+        lo = np.minimum(ta, tb)
+        hi = np.maximum(ta, tb)
+        parallel = d[:, k] == 0
+        inside = np.abs(p0[:, k]) <= half[k]
+        lo = np.where(parallel, np.where(inside, 0.0, 1.0), lo)
+        hi = np.where(parallel, np.where(inside, 1.0, 0.0), hi)
+        t0 = np.maximum(t0, lo)
+        t1 = np.minimum(t1, hi)
+    return np.clip(t1 - t0, 0.0, None) * np.linalg.norm(d, axis=-1)
+
+
 def detect_collision(
         ego_pos: np.ndarray,
         ego_yaw: np.ndarray,
@@ -398,37 +650,125 @@ def detect_collision(
     :return: None if not collision was found, and a tuple with the
              collision type and the agent track_id
     """
+    n_others = other_pos.shape[0]
+    if n_others == 0:
+        return None
+    other_yaw = np.asarray(other_yaw).reshape(n_others)
+    # broad phase: a bounding-circle test prunes most agents before the
+    # (comparatively expensive) SAT test
+    r_ego = 0.5 * np.linalg.norm(np.asarray(ego_extent)[:2])
+    r_others = 0.5 * np.linalg.norm(other_extent[..., :2], axis=-1)
+    d = np.linalg.norm(
+        other_pos[..., :2] - np.asarray(ego_pos)[:2], axis=-1)
+    candidates = np.flatnonzero(d < r_ego + r_others)
+    if candidates.size == 0:
+        return None
+    ego_corners = _box_corners_np(
+        np.asarray(ego_pos)[None], np.asarray(ego_yaw).reshape(1),
+        np.asarray(ego_extent)[None])[0]
+    other_corners = _box_corners_np(
+        other_pos[candidates], other_yaw[candidates],
+        other_extent[candidates])
+    overlap = _obb_overlap_mask(ego_corners, other_corners)
+    for k in np.flatnonzero(overlap):
+        i = candidates[k]
+        intersection_length_per_side = _side_intersection_lengths(
+            ego_pos, float(ego_yaw), ego_extent,
+            other_pos[i], other_yaw[i], other_extent[i])
+        argmax_side = np.argmax(intersection_length_per_side)
+
+        # Remap here is needed because there are two sides that are
+        # mapped to the same collision type CollisionType.SIDE
+        max_collision_types = max(CollisionType).value
+        remap_argmax = min(argmax_side, max_collision_types)
+        collision_type = CollisionType(remap_argmax)
+        return collision_type, int(i)
+    return None
+
+
+def _detect_collision_shapely(
+        ego_pos: np.ndarray,
+        ego_yaw: np.ndarray,
+        ego_extent: np.ndarray,
+        other_pos: np.ndarray,
+        other_yaw: np.ndarray,
+        other_extent: np.ndarray,
+):
+    """Shapely reference implementation of :func:`detect_collision`."""
+    import shapely
     from l5kit.planning import utils
+    n_others = other_pos.shape[0]
+    if n_others == 0:
+        return None
     ego_bbox = utils._get_bounding_box(
         centroid=ego_pos, yaw=ego_yaw, extent=ego_extent)
-    # within_range_mask = utils.within_range(ego_pos, ego_extent, other_pos, other_extent)
-    for i in range(other_pos.shape[0]):
-        agent_bbox = utils._get_bounding_box(
-            other_pos[i], other_yaw[i], other_extent[i])
+    # one trig pass for all agent corners, one C call for all polygons
+    all_corners = _box_corners_np(
+        other_pos, np.asarray(other_yaw).reshape(n_others), other_extent)
+    agent_bboxes = shapely.polygons(all_corners)
+    hits = shapely.intersects(ego_bbox, agent_bboxes)
+    for i in np.flatnonzero(hits):
+        agent_bbox = agent_bboxes[i]
+        front_side, rear_side, left_side, right_side = utils._get_sides(
+            ego_bbox)
+
+        intersection_length_per_side = np.asarray(
+            [
+                agent_bbox.intersection(front_side).length,
+                agent_bbox.intersection(rear_side).length,
+                agent_bbox.intersection(left_side).length,
+                agent_bbox.intersection(right_side).length,
+            ]
+        )
+        argmax_side = np.argmax(intersection_length_per_side)
 
-        if ego_bbox.intersects(agent_bbox):
-            front_side, rear_side, left_side, right_side = utils._get_sides(
-                ego_bbox)
-
-            intersection_length_per_side = np.asarray(
-                [
-                    agent_bbox.intersection(front_side).length,
-                    agent_bbox.intersection(rear_side).length,
-                    agent_bbox.intersection(left_side).length,
-                    agent_bbox.intersection(right_side).length,
-                ]
-            )
-            argmax_side = np.argmax(intersection_length_per_side)
-
-            # Remap here is needed because there are two sides that are
-            # mapped to the same collision type CollisionType.SIDE
-            max_collision_types = max(CollisionType).value
-            remap_argmax = min(argmax_side, max_collision_types)
-            collision_type = CollisionType(remap_argmax)
-            return collision_type, i
+        max_collision_types = max(CollisionType).value
+        remap_argmax = min(argmax_side, max_collision_types)
+        collision_type = CollisionType(remap_argmax)
+        return collision_type, int(i)
     return None
 
 
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _chamfer_distance_map(road_flag, max_dis):
+        """two-pass L1 Chamfer distance transform, saturated at max_dis"""
+        B, H, W = road_flag.shape
+        out = np.empty((B, H, W), dtype=np.float32)
+        for b in numba.prange(B):
+            for i in range(H):
+                for j in range(W):
+                    out[b, i, j] = max_dis if road_flag[b, i, j] == 0 else 0.0
+            for i in range(H):
+                for j in range(W):
+                    d = out[b, i, j]
+                    if i > 0 and out[b, i - 1, j] + 1 < d:
+                        d = out[b, i - 1, j] + 1
+                    if j > 0 and out[b, i, j - 1] + 1 < d:
+                        d = out[b, i, j - 1] + 1
+                    out[b, i, j] = d
+            for i in range(H - 1, -1, -1):
+                for j in range(W - 1, -1, -1):
+                    d = out[b, i, j]
+                    if i < H - 1 and out[b, i + 1, j] + 1 < d:
+                        d = out[b, i + 1, j] + 1
+                    if j < W - 1 and out[b, i, j + 1] + 1 < d:
+                        d = out[b, i, j + 1] + 1
+                    out[b, i, j] = d
+        return out
+
+
+def _distance_map_step(out):
+    out[..., 1:, :] = torch.min(out[..., 1:, :], out[..., :-1, :]+1)
+    out[..., :-1, :] = torch.min(out[..., :-1, :], out[..., 1:, :]+1)
+    out[..., :, 1:] = torch.min(out[..., :, 1:], out[..., :, :-1]+1)
+    out[..., :, :-1] = torch.min(out[..., :, :-1], out[..., :, 1:]+1)
+    return out
+
+
+_compiled_distance_map_step = None
+
+
 def calc_distance_map(road_flag, max_dis=10):
     """mark the image with manhattan distance to the drivable area
 
@@ -436,13 +776,18 @@ def calc_distance_map(road_flag, max_dis=10):
         road_flag (torch.Tensor[B,W,H]): an image with 1 channel, 1 for drivable area, 0 for non-drivable area
         max_dis (int, optional): maximum distance that the result saturates to. Defaults to 10.
     """
+    if numba is not None and road_flag.device.type == "cpu":
+        flag = road_flag.detach().numpy().reshape(-1, *road_flag.shape[-2:])
+        out = _chamfer_distance_map(np.ascontiguousarray(flag), float(max_dis))
+        return torch.from_numpy(out.reshape(road_flag.shape))
+
     out = torch.zeros_like(road_flag, dtype=torch.float)
     out[road_flag == 0] = max_dis
     out[road_flag == 1] = 0
+    global _compiled_distance_map_step
+    if _compiled_distance_map_step is None:
+        _compiled_distance_map_step = _maybe_compile(_distance_map_step)
     for i in range(max_dis-1):
-        out[..., 1:, :] = torch.min(out[..., 1:, :], out[..., :-1, :]+1)
-        out[..., :-1, :] = torch.min(out[..., :-1, :], out[..., 1:, :]+1)
-        out[..., :, 1:] = torch.min(out[..., :, 1:], out[..., :, :-1]+1)
-        out[..., :, :-1] = torch.min(out[..., :, :-1], out[..., :, 1:]+1)
+        out = _compiled_distance_map_step(out)
 
     return out